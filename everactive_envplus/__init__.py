@@ -1,5 +1,6 @@
 """everactive_envplus"""
 
+import everactive_envplus.charts as charts
 import everactive_envplus.color as color
 import everactive_envplus.connection as connection
 import everactive_envplus.utils as utils
@@ -0,0 +1,783 @@
+"""Contains the ChartBuilder class that builds the standard Eversensor readings charts
+from a single, compact copy of the chart data."""
+
+import glob
+import hashlib
+import os
+import tempfile
+from typing import Dict, List, Optional, Union
+
+import altair as alt
+import pandas as pd
+
+import everactive_envplus.log as logger
+from everactive_envplus.color import ColorPalette
+
+log = logger.get_logger()
+
+DEFAULT_CHART_HEIGHT = 300
+DEFAULT_CHART_WIDTH = 700
+DEFAULT_DATA_FORMAT = "inline"
+DEFAULT_DATA_DIR = "altair-data"
+
+DATA_FORMATS = ["inline", "csv"]
+
+FULL_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+READING_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+
+KELVIN_OFFSET = 273.15
+
+ENVPLUS_OPERATING_CAPACITANCE = 2.5 * 1e-3
+ENVPLUS_STORAGE_CAPACITANCE = 800 * 1e-3
+
+# Vega parse type of each column in the chart data. Columns are only present in the
+# chart data when the source readings contain them.
+CHART_COLUMN_TYPES = {
+    "readingDate": "date",
+    "sensor": "string",
+    "temperature": "number",
+    "humidity": "number",
+    "pressureMeasurement": "number",
+    "rssiUplink": "number",
+    "stored_energy": "number",
+    "railCounts_PV_IN_count": "number",
+    "movement": "number",
+}
+
+# Decimal places kept per column. Tooltips display at most two decimal places, so
+# rounding keeps the serialized chart data small without changing what is rendered.
+CHART_COLUMN_PRECISION = {
+    "temperature": 2,
+    "humidity": 2,
+    "pressureMeasurement": 2,
+    "rssiUplink": 0,
+    "stored_energy": 4,
+    "railCounts_PV_IN_count": 0,
+}
+
+# Number of trailing mac address characters used as the short sensor name.
+SENSOR_SHORT_NAME_LENGTH = 5
+
+# ColorPalette colors assigned to sensors when charting several Eversensors: every
+# color at each intensity, in order. Violet and charcoal are left out as they mark
+# movement events and mouseover rules.
+SENSOR_COLORS = ["sky", "midnight", "chartreuse", "dark_teal", "apricot", "sand"]
+SENSOR_COLOR_INTENSITIES = [100, 67, 40]
+
+# Chart data column required to build each chart.
+CHART_NAME2COLUMN = {
+    "temperature": "temperature",
+    "humidity": "humidity",
+    "pressure": "pressureMeasurement",
+    "rssi": "rssiUplink",
+    "stored_energy": "stored_energy",
+}
+
+
+def calculate_stored_energy(
+    vcap: Union[float, pd.Series], scap: Union[float, pd.Series]
+) -> Union[float, pd.Series]:
+    """Calculate and return the Eversensor stored energy in joules.
+
+    Accepts either scalar voltages or pandas Series of voltages.
+    """
+    return (0.5 * ENVPLUS_OPERATING_CAPACITANCE * (vcap**2)) + (
+        0.5 * ENVPLUS_STORAGE_CAPACITANCE * (scap**2)
+    )
+
+
+def _sensor_value(measurements: Optional[List[Dict]], sensor_index: int = 0):
+    """Return the value reported by the requested sensor index, or None if the
+    measurements do not contain a value for that sensor."""
+    if not isinstance(measurements, list):
+        return None
+
+    return next(
+        (m["value"] for m in measurements if m["sensorIndex"] == sensor_index), None
+    )
+
+
+def build_chart_frame(df_readings: pd.DataFrame) -> pd.DataFrame:
+    """Return the compact chart data frame for a pandas DataFrame of Eversensor
+    readings, as returned by EveractiveApi.get_eversensor_readings().
+
+    The chart data holds one row per reading and only the columns plotted by the
+    standard charts. Legend labels and display strings are computed in the chart
+    spec rather than stored per row. Readings of several Eversensors can be combined
+    in one DataFrame; each row keeps its sensor name, the last characters of its mac
+    address (or the full mac address if the short names are not unique).
+
+    Args:
+        df_readings: pandas DataFrame of Eversensor readings
+    """
+    df_readings = df_readings.reset_index(drop=True)
+    columns = df_readings.columns
+
+    frame = pd.DataFrame(
+        {
+            "readingDate": pd.to_datetime(
+                df_readings["readingDate"], utc=True
+            ).dt.strftime(READING_DATE_FORMAT)
+        }
+    )
+
+    if "macAddress" in columns:
+        mac_addresses = df_readings["macAddress"]
+        short_names = mac_addresses.str[-SENSOR_SHORT_NAME_LENGTH:]
+
+        frame["sensor"] = (
+            short_names
+            if short_names.nunique() == mac_addresses.nunique()
+            else mac_addresses
+        )
+
+    # The BME280 sensor used by the ENV+ Eversensor reports two temperatures, off-chip
+    # and on-chip. We use the off-chip temperature to approximate ambient temperature.
+    if "temperatureMeasurements" in columns:
+        frame["temperature"] = (
+            df_readings["temperatureMeasurements"].map(_sensor_value).astype(float)
+            - KELVIN_OFFSET
+        )
+
+    if "humidityMeasurements" in columns:
+        frame["humidity"] = (
+            df_readings["humidityMeasurements"].map(_sensor_value).astype(float)
+        )
+
+    for column in ["pressureMeasurement", "rssiUplink", "railCounts_PV_IN_count"]:
+        if column in columns:
+            frame[column] = df_readings[column].astype(float)
+
+    if ("vcap" in columns) and ("scap" in columns):
+        frame["stored_energy"] = calculate_stored_energy(
+            df_readings["vcap"].astype(float), df_readings["scap"].astype(float)
+        )
+
+    # Stored as 0/1 rather than a boolean so it parses the same way inline and in CSV.
+    if "movementMeasurement_movement" in columns:
+        frame["movement"] = (
+            df_readings["movementMeasurement_movement"].fillna(False).astype(int)
+        )
+
+    frame = frame.round(
+        {k: v for k, v in CHART_COLUMN_PRECISION.items() if k in frame.columns}
+    )
+
+    # Whole-number columns are serialized without a trailing ".0".
+    for column, precision in CHART_COLUMN_PRECISION.items():
+        if (precision == 0) and (column in frame.columns):
+            frame[column] = frame[column].astype("Int64")
+
+    return frame
+
+
+def chart_data_version(frame: pd.DataFrame) -> str:
+    """Return a string version that changes whenever the chart data changes."""
+    digest = hashlib.sha256(",".join(frame.columns).encode())
+    digest.update(pd.util.hash_pandas_object(frame, index=False).values.tobytes())
+
+    return digest.hexdigest()[:16]
+
+
+class ChartBuilder:
+    """Helper class to build the standard Eversensor readings charts.
+
+    Each chart carries a single copy of the chart data, holding only the columns it
+    plots: layers inherit the data from their parent chart, and movement events are
+    drawn by filtering the readings rather than from a separate dataset. dashboard()
+    stacks several charts over one shared copy. Readings from several Eversensors
+    (e.g. concatenated get_eversensor_readings() results) share that copy too, and
+    each chart colors its series by sensor. Built charts are cached until the chart
+    data changes, so displaying a chart again reuses the built chart and its
+    serialized data.
+
+    With data_format="csv", chart data is written once per data version to a CSV
+    file under data_dir and the chart references it by URL instead of embedding it.
+    Use this when the notebook server serves local files (e.g. JupyterLab, Docker).
+    data_dir must be relative to the notebook directory, since the chart URL is
+    resolved by the notebook server. Files for earlier data versions are kept, since
+    previously displayed charts still reference them; call clear_data_files() to
+    remove them.
+    Inline chart data is not subject to Altair's inline row limit.
+
+    Typical usage example:
+        builder = ChartBuilder(df_readings, title_prefix="[a1:b2]")
+        builder.temperature_chart()
+        builder.dashboard()
+
+        builder = ChartBuilder(df_readings, data_format="csv")
+    """
+
+    def __init__(
+        self,
+        df_readings: pd.DataFrame,
+        *,
+        title_prefix: str = "",
+        palette: Optional[ColorPalette] = None,
+        height: int = DEFAULT_CHART_HEIGHT,
+        width: int = DEFAULT_CHART_WIDTH,
+        data_format: str = DEFAULT_DATA_FORMAT,
+        data_dir: str = DEFAULT_DATA_DIR,
+    ) -> None:
+        """Initialize a ChartBuilder object.
+
+        Args:
+            df_readings: pandas DataFrame of Eversensor readings
+            title_prefix: Optional string to prefix chart titles with
+            palette: Optional ColorPalette object. Defaults to a new ColorPalette.
+            height: Int height of each chart in pixels
+            width: Int width of each chart in pixels
+            data_format: String specifying how chart data is transported, either
+                "inline" or "csv". Defaults to "inline".
+                    * "inline" embeds the chart data once in the chart spec, as CSV
+                    * "csv" writes the chart data to a CSV file under data_dir and
+                        references it by URL
+            data_dir: String directory that CSV chart data is written to, relative to
+                the notebook directory
+        """
+        if data_format not in DATA_FORMATS:
+            raise ValueError("data_format must be either 'inline' or 'csv'")
+
+        if os.path.isabs(data_dir):
+            raise ValueError("data_dir must be relative to the notebook directory")
+
+        self._title_prefix = title_prefix
+        self._palette = palette if palette is not None else ColorPalette()
+        self._height = height
+        self._width = width
+        self._data_format = data_format
+        self._data_dir = data_dir
+
+        self._cache: Dict[str, alt.TopLevelMixin] = {}
+        self._data_version: Optional[str] = None
+
+        self.set_readings(df_readings)
+
+    @property
+    def data_version(self) -> str:
+        """Return the version of the current chart data."""
+        return self._data_version
+
+    @property
+    def chart_names(self) -> List[str]:
+        """Return the names of the charts that can be built from the current
+        readings."""
+        return [
+            name
+            for name, column in CHART_NAME2COLUMN.items()
+            if column in self._frame.columns
+        ]
+
+    def set_readings(self, df_readings: pd.DataFrame) -> None:
+        """Replace the readings that charts are built from.
+
+        The readings are always reduced to chart data and hashed; cached charts are
+        kept if the resulting chart data is unchanged, and cleared otherwise.
+
+        Args:
+            df_readings: pandas DataFrame of Eversensor readings
+        """
+        frame = build_chart_frame(df_readings)
+        data_version = chart_data_version(frame)
+
+        if data_version == self._data_version:
+            return
+
+        self._frame = frame
+        self._sensors = (
+            sorted(frame["sensor"].dropna().unique())
+            if "sensor" in frame.columns
+            else []
+        )
+        self._sensor_colors = self._build_sensor_colors(len(self._sensors))
+        self._data_version = data_version
+        self._data: Dict[str, Union[alt.InlineData, alt.UrlData]] = {}
+        self._cache = {}
+
+    def temperature_chart(self) -> alt.LayerChart:
+        """Return the temperature (Celsius) chart."""
+        return self._get_chart("temperature")
+
+    def humidity_chart(self) -> alt.LayerChart:
+        """Return the relative humidity chart."""
+        return self._get_chart("humidity")
+
+    def pressure_chart(self) -> alt.LayerChart:
+        """Return the barometric pressure chart."""
+        return self._get_chart("pressure")
+
+    def rssi_chart(self) -> alt.LayerChart:
+        """Return the RSSI uplink chart."""
+        return self._get_chart("rssi")
+
+    def stored_energy_chart(self) -> alt.LayerChart:
+        """Return the stored energy vs. PV IN rail count chart."""
+        return self._get_chart("stored_energy")
+
+    def dashboard(self, chart_names: Optional[List[str]] = None) -> alt.VConcatChart:
+        """Return the requested charts stacked vertically, sharing one copy of the
+        chart data.
+
+        Args:
+            chart_names: Optional list of chart names to include, in order. Defaults
+                to all charts that can be built from the current readings.
+        """
+        if chart_names is None:
+            chart_names = self.chart_names
+
+        cache_key = f"dashboard:{','.join(chart_names)}"
+
+        if cache_key not in self._cache:
+            charts = [self._build_chart(name) for name in chart_names]
+
+            self._cache[cache_key] = alt.vconcat(
+                *charts, data=self._chart_data(chart_names)
+            ).configure_title(anchor="start")
+
+        return self._cache[cache_key]
+
+    def clear_data_files(self) -> None:
+        """Remove the CSV chart data files under data_dir, except the file for the
+        current data version.
+
+        Files are removed regardless of which builder or kernel session wrote them, so
+        previously displayed charts that reference them render empty afterwards.
+        """
+        current_path = os.path.join(
+            self._data_dir, f"readings-{self._data_version}.csv"
+        )
+
+        for path in glob.glob(os.path.join(self._data_dir, "readings-*.csv")):
+            if path != current_path:
+                os.remove(path)
+
+    def _get_chart(self, name: str) -> alt.LayerChart:
+        """Return the named standalone chart, building it if it is not cached."""
+        if name not in self._cache:
+            chart = self._build_chart(name)
+
+            self._cache[name] = chart.properties(
+                data=self._chart_data([name])
+            ).configure_title(anchor="start")
+
+        return self._cache[name]
+
+    def _chart_columns(self, chart_names: List[str]) -> List[str]:
+        """Return the chart data columns plotted by the named charts."""
+        columns = {"readingDate", *[CHART_NAME2COLUMN[name] for name in chart_names]}
+
+        if "stored_energy" in chart_names:
+            columns.add("railCounts_PV_IN_count")
+
+        if len(self._sensors) > 1:
+            columns.add("sensor")
+
+        if self._has_movements():
+            columns.add("movement")
+
+        return [column for column in self._frame.columns if column in columns]
+
+    def _chart_data(self, chart_names: List[str]) -> Union[alt.InlineData, alt.UrlData]:
+        """Return the chart data for the named charts in the configured data format.
+
+        Inline chart data only holds the columns plotted by the named charts, as it is
+        embedded in every chart it is displayed with. CSV chart data files hold all
+        columns, so every chart references the same file.
+        """
+        if self._data_format == "inline":
+            columns = self._chart_columns(chart_names)
+        else:
+            columns = list(self._frame.columns)
+
+        data_key = ",".join(columns)
+
+        if data_key in self._data:
+            return self._data[data_key]
+
+        data_format = alt.CsvDataFormat(
+            type="csv",
+            parse={column: CHART_COLUMN_TYPES[column] for column in columns},
+        )
+
+        # Inline data is embedded as a CSV string, which does not repeat column names
+        # per row. It bypasses Altair's data transformer (and so its inline row limit),
+        # and naming it keeps Altair from copying it into the top-level datasets.
+        if self._data_format == "inline":
+            columns_hash = hashlib.sha256(data_key.encode()).hexdigest()[:8]
+
+            self._data[data_key] = alt.InlineData(
+                name=f"readings-{self._data_version}-{columns_hash}",
+                values=self._frame[columns].to_csv(index=False),
+                format=data_format,
+            )
+            return self._data[data_key]
+
+        # File names are keyed by data version, so unchanged readings are written once.
+        os.makedirs(self._data_dir, exist_ok=True)
+        path = os.path.join(self._data_dir, f"readings-{self._data_version}.csv")
+
+        if not os.path.exists(path):
+            self._write_data_file(path)
+
+        self._data[data_key] = alt.UrlData(
+            url=path.replace(os.sep, "/"), format=data_format
+        )
+
+        return self._data[data_key]
+
+    def _write_data_file(self, path: str) -> None:
+        """Write the chart data to a CSV file at path.
+
+        The data is written to a temporary file that is then moved into place, so an
+        interrupted write never leaves a truncated file at path.
+        """
+        fd, temp_path = tempfile.mkstemp(dir=self._data_dir, suffix=".tmp")
+
+        try:
+            with os.fdopen(fd, "w", newline="") as f:
+                self._frame.to_csv(f, index=False)
+
+            os.replace(temp_path, path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+    def _build_chart(self, name: str) -> alt.LayerChart:
+        """Return the named chart without data or top-level configuration."""
+        if name not in CHART_NAME2COLUMN:
+            raise KeyError(f"Chart {name} does not exist")
+
+        if CHART_NAME2COLUMN[name] not in self._frame.columns:
+            raise KeyError(f"Readings do not contain the data for chart {name}")
+
+        if name == "temperature":
+            return self._measurement_chart(
+                "temperature",
+                legend_label="Temperature",
+                title="Temperature (Celsius)",
+                axis_title="Temperature (C)",
+                tooltips={
+                    "Celsius": "format(datum.temperature, '.1f') + ' ºC'",
+                    "Fahrenheit": "format(datum.temperature * 9 / 5 + 32, '.1f') + ' ºF'",
+                },
+            )
+
+        if name == "humidity":
+            return self._measurement_chart(
+                "humidity",
+                legend_label="Relative Humidity",
+                title="Relative Humidity",
+                axis_title="Relative Humidity (%)",
+                tooltips={
+                    "Relative Humidity": "format(datum.humidity, '.1f') + '%'",
+                },
+            )
+
+        if name == "pressure":
+            return self._measurement_chart(
+                "pressureMeasurement",
+                legend_label="Barometric Pressure",
+                title="Barometric Pressure",
+                axis_title="Barometric Pressure (hPa)",
+                tooltips={
+                    "Barometric Pressure": "format(datum.pressureMeasurement, '.0f') + ' hPa'",
+                },
+            )
+
+        if name == "rssi":
+            return self._measurement_chart(
+                "rssiUplink",
+                legend_label="RSSI Uplink",
+                title="RSSI Uplink",
+                axis_title="RSSI Uplink",
+                tooltips={
+                    "RSSI Uplink": "format(datum.rssiUplink, '.0f')",
+                },
+            )
+
+        return self._stored_energy_chart()
+
+    def _title(self, title: str) -> str:
+        """Return the chart title with the configured title prefix."""
+        return f"{self._title_prefix} {title}".strip()
+
+    def _legend_color(
+        self, legend_label: str, color: str, legend: Optional[alt.Legend]
+    ) -> alt.Color:
+        """Return a color encoding for a single, constant legend label."""
+        return alt.Color(
+            "legend_label:N",
+            legend=legend,
+            scale=alt.Scale(domain=[legend_label], range=[color]),
+        )
+
+    def _series_color(
+        self, legend_label: str, color: str, legend: Optional[alt.Legend]
+    ) -> alt.Color:
+        """Return the color encoding of a measurement series: a single legend label
+        for one sensor, or one color per sensor for several sensors."""
+        if len(self._sensors) <= 1:
+            return self._legend_color(legend_label, color, legend)
+
+        return alt.Color(
+            "sensor:N",
+            legend=alt.Legend(title="Sensor") if legend is not None else None,
+            scale=alt.Scale(domain=self._sensors, range=self._sensor_colors),
+        )
+
+    def _build_sensor_colors(self, sensor_count: int) -> List[str]:
+        """Return one hex color per sensor, repeating colors (with a warning) only when
+        there are more sensors than palette colors."""
+        colors = [
+            getattr(self._palette, name)(intensity)
+            for intensity in SENSOR_COLOR_INTENSITIES
+            for name in SENSOR_COLORS
+        ]
+
+        if sensor_count > len(colors):
+            log.warning(
+                f"Charting {sensor_count} sensors with {len(colors)} colors; "
+                "some sensors share a color"
+            )
+
+        return [colors[i % len(colors)] for i in range(sensor_count)]
+
+    def _sensor_tooltips(self) -> List[alt.Tooltip]:
+        """Return the sensor tooltip when charting several sensors."""
+        if len(self._sensors) <= 1:
+            return []
+
+        return [alt.Tooltip("sensor:N", title="Sensor")]
+
+    def _has_movements(self) -> bool:
+        """Return True if the readings contain movement events."""
+        return ("movement" in self._frame.columns) and bool(
+            self._frame["movement"].any()
+        )
+
+    def _movement_layers(self) -> List[alt.Chart]:
+        """Return the movement event layer, or no layers if the readings contain no
+        movement events."""
+        if not self._has_movements():
+            return []
+
+        return [
+            alt.Chart()
+            .transform_filter("datum.movement")
+            .transform_calculate(legend_label="'Movement Event'")
+            .mark_rule()
+            .encode(
+                alt.X("readingDate:T"),
+                self._legend_color(
+                    "Movement Event", self._palette.violet(), alt.Legend(title=None)
+                ),
+                tooltip=[
+                    *self._sensor_tooltips(),
+                    alt.Tooltip(
+                        "readingDate:T",
+                        title="Movement Event",
+                        format=FULL_DATETIME_FORMAT,
+                    ),
+                ],
+            )
+        ]
+
+    def _measurement_chart(
+        self,
+        field: str,
+        *,
+        legend_label: str,
+        title: str,
+        axis_title: str,
+        tooltips: Dict[str, str],
+    ) -> alt.LayerChart:
+        """Return a point chart of a single measurement, layered with movement events.
+
+        Args:
+            field: String chart data column to plot
+            legend_label: String legend label of the measurement
+            title: String chart title, without the title prefix
+            axis_title: String y axis title
+            tooltips: Dict of tooltip title to Vega expression computing the tooltip
+                display string
+        """
+        display_fields = {
+            f"display_{i}": expr for i, expr in enumerate(tooltips.values())
+        }
+
+        measurements = (
+            alt.Chart()
+            .transform_filter(f"isValid(datum.{field})")
+            .transform_calculate(legend_label=f"'{legend_label}'", **display_fields)
+            .mark_circle()
+            .encode(
+                alt.X("readingDate:T", axis=alt.Axis(title=None)),
+                alt.Y(f"{field}:Q", axis=alt.Axis(title=axis_title)),
+                self._series_color(
+                    legend_label, self._palette.sky(), alt.Legend(title="Legend")
+                ),
+                tooltip=[
+                    *self._sensor_tooltips(),
+                    alt.Tooltip(
+                        "readingDate:T", title="Reading", format=FULL_DATETIME_FORMAT
+                    ),
+                    *[
+                        alt.Tooltip(f"{display_field}:N", title=tooltip_title)
+                        for display_field, tooltip_title in zip(
+                            display_fields, tooltips
+                        )
+                    ],
+                ],
+            )
+        )
+
+        return (
+            alt.layer(measurements, *self._movement_layers())
+            .resolve_scale(color="independent")
+            .properties(
+                title=self._title(title), height=self._height, width=self._width
+            )
+            .interactive(bind_y=False)
+        )
+
+    def _stored_energy_chart(self) -> alt.LayerChart:
+        """Return the stored energy chart, layered with the PV IN rail count (when
+        present in the readings) and movement events."""
+        # Create a selection that chooses the nearest point & selects based on x value.
+        nearest = alt.selection(
+            type="single",
+            nearest=True,
+            on="mouseover",
+            fields=["readingDate"],
+            empty="none",
+        )
+
+        # Create transparent selectors across the chart - this tells us the x value on
+        # mouseover.
+        selectors = (
+            alt.Chart()
+            .mark_point()
+            .encode(x="readingDate:T", opacity=alt.value(0))
+            .add_selection(nearest)
+        )
+
+        # Draw a rule at the location of the selection.
+        rule = (
+            alt.Chart()
+            .mark_rule(color=self._palette.charcoal())
+            .encode(x="readingDate:T")
+            .transform_filter(nearest)
+        )
+
+        # Data labels name the sensor when charting several sensors.
+        label_prefix = "datum.sensor + ' ' + " if len(self._sensors) > 1 else ""
+
+        data_label_params = {
+            "align": "left",
+            "dx": 5,
+            "color": self._palette.charcoal(),
+            "fontWeight": 600,
+        }
+
+        stored_energy_base = (
+            alt.Chart()
+            .transform_filter("isValid(datum.stored_energy)")
+            .transform_calculate(
+                legend_label="'Stored Energy'",
+                display_stored_energy=f"{label_prefix}'Stored Energy: ' + format(datum.stored_energy, '.2f') + ' J'",
+            )
+            .encode(
+                alt.X("readingDate:T", axis=alt.Axis(title=None)),
+                alt.Y("stored_energy:Q", axis=alt.Axis(title="Stored Energy (J)")),
+            )
+        )
+
+        stored_energy_mark = stored_energy_base.mark_line(point=True).encode(
+            self._series_color(
+                "Stored Energy", self._palette.sky(), alt.Legend(title="Legend")
+            )
+        )
+
+        stored_energy_area = stored_energy_base.mark_area(opacity=0.1).encode(
+            alt.Y("stored_energy:Q", axis=None, stack=None),
+            self._series_color("Stored Energy", self._palette.sky(), None),
+        )
+
+        stored_energy_data_label = stored_energy_base.mark_text(
+            **data_label_params, dy=-10
+        ).encode(
+            alt.Y("stored_energy:Q", axis=None),
+            text=alt.condition(nearest, "display_stored_energy:N", alt.value(" ")),
+        )
+
+        rail_count_layers = []
+
+        if "railCounts_PV_IN_count" in self._frame.columns:
+            rail_count_base = (
+                alt.Chart()
+                .transform_filter("isValid(datum.railCounts_PV_IN_count)")
+                .transform_calculate(
+                    legend_label="'PV IN Rail Count'",
+                    display_rail_count=f"{label_prefix}'PV IN Rail Count: ' + format(datum.railCounts_PV_IN_count, '.0f')",
+                )
+                .encode(
+                    alt.X("readingDate:T", axis=alt.Axis(title=None)),
+                    alt.Y(
+                        "railCounts_PV_IN_count:Q",
+                        axis=alt.Axis(title="PV IN Rail Count"),
+                    ),
+                )
+            )
+
+            if len(self._sensors) <= 1:
+                rail_count_chart = rail_count_base.mark_circle().encode(
+                    self._legend_color(
+                        "PV IN Rail Count",
+                        self._palette.midnight(),
+                        alt.Legend(title=None),
+                    )
+                )
+            else:
+                # With several sensors, rail counts reuse the stored energy sensor
+                # colors and are told apart by shape, with their own legend entry.
+                rail_count_chart = rail_count_base.mark_point(filled=True).encode(
+                    self._series_color(
+                        "PV IN Rail Count", self._palette.midnight(), None
+                    ),
+                    alt.Shape(
+                        "legend_label:N",
+                        legend=alt.Legend(title=None),
+                        scale=alt.Scale(
+                            domain=["PV IN Rail Count"], range=["triangle-up"]
+                        ),
+                    ),
+                )
+
+            rail_count_data_label = rail_count_base.mark_text(
+                **data_label_params, dy=10
+            ).encode(
+                alt.Y("railCounts_PV_IN_count:Q", axis=None),
+                text=alt.condition(nearest, "display_rail_count:N", alt.value(" ")),
+            )
+
+            rail_count_layers = [rail_count_chart, rail_count_data_label]
+
+        return (
+            alt.layer(
+                stored_energy_mark,
+                stored_energy_area,
+                *rail_count_layers[:1],
+                *self._movement_layers(),
+                selectors,
+                rule,
+                stored_energy_data_label,
+                *rail_count_layers[1:],
+            )
+            .resolve_scale(y="independent", color="independent")
+            .properties(
+                title=self._title("Stored Energy vs. PV IN Rail Count"),
+                height=self._height,
+                width=self._width,
+            )
+            .interactive(bind_y=False)
+        )
@@ -0,0 +1,241 @@
+import os
+
+import pandas as pd
+import pytest
+
+from everactive_envplus.charts import (
+    ChartBuilder,
+    build_chart_frame,
+    chart_data_version,
+)
+
+
+def make_readings(n=3, mac_address="aa:bb:cc:dd:00:01"):
+    return pd.DataFrame(
+        {
+            "macAddress": mac_address,
+            "readingDate": pd.date_range(
+                "2023-01-01", periods=n, freq="min", tz="UTC"
+            ).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
+            "temperatureMeasurements": [
+                [
+                    {"sensorIndex": 1, "value": 300.0},
+                    {"sensorIndex": 0, "value": 273.15 + i},
+                ]
+                for i in range(n)
+            ],
+            "humidityMeasurements": [[{"sensorIndex": 0, "value": 40.0}]] * n,
+            "pressureMeasurement": 1000.0,
+            "rssiUplink": -70.0,
+            "vcap": 2.0,
+            "scap": 1.0,
+            "railCounts_PV_IN_count": 12.0,
+            "movementMeasurement_movement": [True] + [None] * (n - 1),
+        }
+    )
+
+
+def test_build_chart_frame():
+    frame = build_chart_frame(make_readings())
+
+    # Off-chip temperature (sensorIndex 0), converted from Kelvin to Celsius.
+    assert frame["temperature"].tolist() == [0.0, 1.0, 2.0]
+    assert frame["humidity"].tolist() == [40.0, 40.0, 40.0]
+    assert frame["movement"].tolist() == [1, 0, 0]
+    assert frame["sensor"].tolist() == ["00:01"] * 3
+    assert frame["readingDate"][0] == "2023-01-01T00:00:00Z"
+    assert frame["rssiUplink"].dtype == "Int64"
+    assert frame["railCounts_PV_IN_count"].dtype == "Int64"
+
+
+def test_build_chart_frame_absent_columns():
+    frame = build_chart_frame(
+        make_readings().drop(
+            columns=["temperatureMeasurements", "movementMeasurement_movement", "scap"]
+        )
+    )
+
+    assert "temperature" not in frame.columns
+    assert "movement" not in frame.columns
+    assert "stored_energy" not in frame.columns
+    assert "humidity" in frame.columns
+
+
+def test_build_chart_frame_missing_sensor_index():
+    readings = make_readings()
+    readings.at[1, "temperatureMeasurements"] = [{"sensorIndex": 1, "value": 300.0}]
+
+    assert build_chart_frame(readings)["temperature"].isna().tolist() == [
+        False,
+        True,
+        False,
+    ]
+
+
+def test_chart_data_version():
+    frame = build_chart_frame(make_readings())
+
+    assert chart_data_version(frame) == chart_data_version(frame.copy())
+
+    changed = frame.copy()
+    changed.loc[0, "temperature"] = 5.0
+
+    assert chart_data_version(frame) != chart_data_version(changed)
+
+
+def test_set_readings_cache():
+    readings = make_readings()
+    builder = ChartBuilder(readings)
+    chart = builder.temperature_chart()
+
+    builder.set_readings(readings.copy())
+    assert builder.temperature_chart() is chart
+
+    changed = readings.copy()
+    changed["pressureMeasurement"] = 900.0
+    builder.set_readings(changed)
+    assert builder.temperature_chart() is not chart
+
+
+def test_dashboard_single_dataset():
+    spec = ChartBuilder(make_readings()).dashboard().to_dict()
+
+    assert "datasets" not in spec
+    assert spec["data"]["format"]["type"] == "csv"
+    assert spec["data"]["format"]["parse"]["readingDate"] == "date"
+    assert spec["data"]["values"].splitlines()[1].startswith("2023-01-01T00:00:00Z,")
+    assert all("data" not in chart for chart in spec["vconcat"])
+
+
+def test_chart_data_columns():
+    builder = ChartBuilder(make_readings())
+
+    header = builder.temperature_chart().to_dict()["data"]["values"].splitlines()[0]
+    assert header == "readingDate,temperature,movement"
+
+    header = builder.stored_energy_chart().to_dict()["data"]["values"].splitlines()[0]
+    assert header == "readingDate,railCounts_PV_IN_count,stored_energy,movement"
+
+
+def test_chart_data_size():
+    builder = ChartBuilder(make_readings(1440))
+    dashboard_size = len(builder.dashboard().to_dict()["data"]["values"])
+
+    for name in builder.chart_names:
+        chart = getattr(builder, f"{name}_chart")()
+
+        assert len(chart.to_dict()["data"]["values"]) < dashboard_size
+
+
+def test_inline_data_over_row_limit():
+    spec = ChartBuilder(make_readings(6000)).dashboard().to_dict()
+
+    # Header row plus one row per reading.
+    assert len(spec["data"]["values"].splitlines()) == 6001
+
+
+def test_multiple_sensors():
+    readings = pd.concat(
+        [
+            make_readings(mac_address="aa:bb:cc:dd:00:01"),
+            make_readings(mac_address="aa:bb:cc:dd:00:02"),
+        ]
+    )
+    spec = ChartBuilder(readings).temperature_chart().to_dict()
+
+    assert len(spec["data"]["values"].splitlines()) == 7
+    assert spec["layer"][0]["encoding"]["color"]["field"] == "sensor"
+    assert spec["layer"][0]["encoding"]["color"]["scale"]["domain"] == [
+        "00:01",
+        "00:02",
+    ]
+
+
+def test_multiple_sensors_rail_counts():
+    readings = pd.concat(
+        [
+            make_readings(mac_address="aa:bb:cc:dd:00:01"),
+            make_readings(mac_address="aa:bb:cc:dd:00:02"),
+        ]
+    )
+    spec = ChartBuilder(readings).stored_energy_chart().to_dict()
+    rail_count_layer = next(
+        layer
+        for layer in spec["layer"]
+        if layer["encoding"].get("y", {}).get("field") == "railCounts_PV_IN_count"
+    )
+
+    assert rail_count_layer["encoding"]["color"]["field"] == "sensor"
+    assert rail_count_layer["encoding"]["shape"]["scale"]["domain"] == [
+        "PV IN Rail Count"
+    ]
+    assert rail_count_layer["encoding"]["shape"]["legend"] is not None
+
+
+def test_sensor_colors_unique(caplog):
+    readings = pd.concat(
+        [make_readings(mac_address=f"aa:bb:cc:dd:00:{i:02}") for i in range(8)]
+    )
+    spec = ChartBuilder(readings).temperature_chart().to_dict()
+    scale = spec["layer"][0]["encoding"]["color"]["scale"]
+
+    assert len(scale["domain"]) == 8
+    assert len(set(scale["range"])) == 8
+    assert "share a color" not in caplog.text
+
+
+def test_sensor_colors_repeat_warning(caplog):
+    readings = pd.concat(
+        [make_readings(n=1, mac_address=f"aa:bb:cc:dd:{i:05}") for i in range(20)]
+    )
+    ChartBuilder(readings)
+
+    assert "some sensors share a color" in caplog.text
+
+
+def test_csv_data(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    readings = make_readings()
+    builder = ChartBuilder(readings, data_format="csv")
+
+    spec = builder.dashboard().to_dict()
+    builder.temperature_chart().to_dict()
+
+    assert "datasets" not in spec
+    assert spec["data"]["url"] == f"altair-data/readings-{builder.data_version}.csv"
+    assert spec["data"]["format"]["parse"]["readingDate"] == "date"
+    assert spec["data"]["format"]["parse"]["temperature"] == "number"
+    assert os.listdir("altair-data") == [f"readings-{builder.data_version}.csv"]
+
+    previous_file = f"readings-{builder.data_version}.csv"
+
+    changed = readings.copy()
+    changed["pressureMeasurement"] = 900.0
+    builder.set_readings(changed)
+    builder.dashboard()
+
+    current_file = f"readings-{builder.data_version}.csv"
+
+    # Earlier outputs may still reference the previous file.
+    assert sorted(os.listdir("altair-data")) == sorted([previous_file, current_file])
+
+    builder.clear_data_files()
+
+    assert os.listdir("altair-data") == [current_file]
+
+
+def test_csv_data_dir_must_be_relative(tmp_path):
+    with pytest.raises(ValueError):
+        ChartBuilder(make_readings(), data_format="csv", data_dir=str(tmp_path))
+
+
+def test_build_chart_unknown_chart():
+    with pytest.raises(KeyError):
+        ChartBuilder(make_readings())._build_chart("wind_speed")
+
+
+def test_build_chart_missing_data():
+    readings = make_readings().drop(columns=["rssiUplink"])
+
+    with pytest.raises(KeyError):
+        ChartBuilder(readings)._build_chart("rssi")